@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 from typing import List, Dict, Tuple
 
 
@@ -9,6 +10,7 @@ class AccountsConfig:
         """Initialize accounts configuration from environment variables."""
         self.tokens = self._load_tokens()
         self.accounts = self._load_accounts()
+        self._account_id_set = frozenset(acc['account_id'] for acc in self.accounts)
 
     def _load_tokens(self) -> List[str]:
         """
@@ -57,18 +59,21 @@ class AccountsConfig:
             if not item:
                 continue
 
-            try:
-                account_id, table_name = item.split(':')
-                accounts.append({
-                    'account_id': account_id.strip(),
-                    'table': table_name.strip()
-                })
-            except ValueError:
+            account_id, sep, table_name = item.partition(':')
+            account_id = account_id.strip()
+            table_name = table_name.strip()
+
+            if not sep or not account_id or not table_name or ':' in table_name:
                 raise ValueError(
                     f"Invalid account configuration format: '{item}'. "
                     f"Expected format: account_id:table_name"
                 )
 
+            accounts.append({
+                'account_id': account_id,
+                'table': table_name
+            })
+
         if not accounts:
             raise ValueError("No valid Meta accounts found in configuration.")
 
@@ -111,6 +116,30 @@ class AccountsConfig:
         """
         return self.accounts[start_idx:end_idx]
 
+    def get_accounts_with_tokens(self) -> List[Tuple[Dict[str, str], str]]:
+        """
+        Get all accounts paired with their rotated tokens.
+
+        Returns:
+            List of (account_dict, token_string) tuples in configuration order
+        """
+        return [self.get_account_with_token(i) for i in range(len(self.accounts))]
+
+    def group_accounts_by_token(self) -> Dict[int, Tuple[str, List[Dict[str, str]]]]:
+        """
+        Group all accounts by the token assigned to them through rotation.
+
+        Returns:
+            Mapping of token index (position in ``tokens``) to
+            (token_string, list of account dicts using that token)
+        """
+        groups = {}
+        for account_index, account in enumerate(self.accounts):
+            token_index = account_index % len(self.tokens)
+            groups.setdefault(token_index, (self.tokens[token_index], []))[1].append(account)
+
+        return groups
+
     def split_accounts_into_groups(self, num_groups: int = 2) -> List[List[Dict[str, str]]]:
         """
         Split accounts into groups for parallel task execution.
@@ -121,12 +150,40 @@ class AccountsConfig:
         Returns:
             List of account groups
         """
-        total_accounts = len(self.accounts)
-        accounts_per_group = (total_accounts + num_groups - 1) // num_groups
+        return self._split_into_groups(self.accounts, num_groups)
+
+    def split_accounts_with_tokens_into_groups(
+        self,
+        num_groups: int = 2
+    ) -> List[List[Tuple[Dict[str, str], str]]]:
+        """
+        Split (account, token) pairs into groups for parallel task execution.
+
+        Groups follow tokens: every account using a given token lands in the
+        same group, so parallel groups never share a token. With fewer tokens
+        than num_groups, fewer (non-empty) groups are returned.
+
+        Args:
+            num_groups: Maximum number of groups to create
+
+        Returns:
+            List of groups of (account_dict, token_string) tuples
+        """
+        groups = [[] for _ in range(min(num_groups, len(self.tokens)))]
+        for token_index, (token, accounts) in self.group_accounts_by_token().items():
+            groups[token_index % len(groups)].extend((account, token) for account in accounts)
+
+        return groups
+
+    @staticmethod
+    def _split_into_groups(items: List, num_groups: int) -> List[List]:
+        """Split a list into at most num_groups contiguous, evenly sized groups."""
+        total_items = len(items)
+        items_per_group = (total_items + num_groups - 1) // num_groups
 
         groups = []
-        for i in range(0, total_accounts, accounts_per_group):
-            groups.append(self.accounts[i:i + accounts_per_group])
+        for i in range(0, total_items, items_per_group):
+            groups.append(items[i:i + items_per_group])
 
         return groups
 
@@ -155,8 +212,7 @@ class AccountsConfig:
             raise ValueError("No tokens configured")
 
         # Check for duplicate account IDs
-        account_ids = [acc['account_id'] for acc in self.accounts]
-        if len(account_ids) != len(set(account_ids)):
+        if len(self._account_id_set) != len(self.accounts):
             raise ValueError("Duplicate account IDs found in configuration")
 
         # Check for duplicate table names
@@ -165,3 +221,17 @@ class AccountsConfig:
             raise ValueError("Duplicate table names found in configuration")
 
         return True
+
+
+@lru_cache(maxsize=1)
+def get_accounts_config() -> AccountsConfig:
+    """
+    Get the process-wide accounts configuration.
+
+    The configuration is parsed from the environment once per process, so
+    repeated DAG parses reuse it instead of re-reading META_ACCOUNTS.
+
+    Returns:
+        Shared AccountsConfig instance
+    """
+    return AccountsConfig()
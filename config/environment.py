@@ -0,0 +1,25 @@
+from functools import lru_cache
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+
+def load_env_file(env_path: Path) -> None:
+    """
+    Load a .env file into the process environment.
+
+    The file is parsed at most once per modification time, so repeated DAG
+    parses in the same process skip re-reading it. Variables already set in
+    the environment are never overridden.
+
+    Args:
+        env_path: Path to the .env file
+    """
+    if env_path.exists():
+        _load_env_file(str(env_path), env_path.stat().st_mtime)
+
+
+@lru_cache(maxsize=1)
+def _load_env_file(path: str, mtime: float) -> None:
+    """Parse the .env file; cached on (path, mtime)."""
+    load_dotenv(path, override=False)
@@ -8,21 +8,20 @@ from airflow.operators.python_operator import PythonOperator
 from airflow.utils.task_group import TaskGroup
 from airflow.utils.dates import days_ago
 from airflow.utils.trigger_rule import TriggerRule
-from dotenv import load_dotenv
 
 # Add project root to path for imports
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-# Load environment variables
-env_path = project_root / '.env'
-if env_path.exists():
-    load_dotenv(env_path)
+# Load environment variables (parsed once per .env version)
+from config.environment import load_env_file
+
+load_env_file(project_root / '.env')
 
 # Import project modules
-from utils.database import DatabaseManager, DatabaseConfig
-from utils.graph_api import extract_meta_ads_data
-from config.accounts_config import AccountsConfig
+from utils.database import get_db_manager
+from utils.graph_api import extract_meta_ads_data, extract_meta_ads_data_batch
+from config.accounts_config import get_accounts_config
 
 
 # ============================================================================
@@ -35,6 +34,8 @@ MAX_ACTIVE_RUNS = 1
 RETRIES = int(os.getenv('AIRFLOW_RETRIES', '2'))
 RETRY_DELAY_MINUTES = int(os.getenv('AIRFLOW_RETRY_DELAY_MINUTES', '5'))
 OWNER = os.getenv('AIRFLOW_OWNER', 'data-engineering')
+# One extraction task per token (batched Graph API calls) instead of per account
+USE_BATCH_REQUESTS = os.getenv('GRAPH_API_BATCH_REQUESTS', 'false').lower() == 'true'
 
 
 # ============================================================================
@@ -51,20 +52,35 @@ def extract_account_data(account_id: str, token: str, table_name: str, **kwargs)
         table_name: Target table name for ads data
         **kwargs: Airflow context (automatically provided)
     """
-    db_config = DatabaseConfig()
-    db_manager = DatabaseManager(db_config)
-
-    try:
-        extract_meta_ads_data(
-            account_id=account_id,
-            access_token=token,
-            table_name=table_name,
-            actions_table_name=f"{table_name}_actions",
-            db_manager=db_manager,
-            schema=db_config.postgres_schema
-        )
-    finally:
-        db_manager.dispose()
+    db_manager = get_db_manager()
+
+    extract_meta_ads_data(
+        account_id=account_id,
+        access_token=token,
+        table_name=table_name,
+        actions_table_name=f"{table_name}_actions",
+        db_manager=db_manager,
+        schema=db_manager.config.postgres_schema
+    )
+
+
+def extract_accounts_batch(accounts: list, token: str, **kwargs) -> None:
+    """
+    Extract data for several Meta Ads accounts sharing one token.
+
+    Args:
+        accounts: Account configurations ({'account_id': ..., 'table': ...})
+        token: Graph API access token shared by the accounts
+        **kwargs: Airflow context (automatically provided)
+    """
+    db_manager = get_db_manager()
+
+    extract_meta_ads_data_batch(
+        accounts=accounts,
+        access_token=token,
+        db_manager=db_manager,
+        schema=db_manager.config.postgres_schema
+    )
 
 
 def sync_to_sqlserver(**kwargs) -> None:
@@ -77,8 +93,7 @@ def sync_to_sqlserver(**kwargs) -> None:
     Args:
         **kwargs: Airflow context (automatically provided)
     """
-    db_config = DatabaseConfig()
-    db_manager = DatabaseManager(db_config)
+    db_manager = get_db_manager()
 
     # Tables to sync: view_name -> target_table
     sync_mappings = [
@@ -86,22 +101,23 @@ def sync_to_sqlserver(**kwargs) -> None:
         {"view": "vw_graph_ads_actions", "table": "graph_ads_actions"},
     ]
 
-    try:
-        for mapping in sync_mappings:
-            db_manager.sync_postgres_to_sqlserver(
-                view_name=mapping['view'],
-                target_table=mapping['table'],
-                source_schema=db_config.postgres_schema,
-                target_schema=db_config.sqlserver_schema
-            )
-    finally:
-        db_manager.dispose()
+    for mapping in sync_mappings:
+        db_manager.sync_postgres_to_sqlserver(
+            view_name=mapping['view'],
+            target_table=mapping['table'],
+            source_schema=db_manager.config.postgres_schema,
+            target_schema=db_manager.config.sqlserver_schema
+        )
 
 
 # ============================================================================
 # DAG Definition
 # ============================================================================
 
+# Accounts configuration (parsed once per process)
+accounts_config = get_accounts_config()
+accounts_config.validate_configuration()
+
 default_args = {
     'owner': OWNER,
     'retries': RETRIES,
@@ -122,42 +138,56 @@ with DAG(
     description='Extract Meta Ads data from Graph API for multiple accounts',
 ) as dag:
 
-    # Initialize accounts configuration
-    accounts_config = AccountsConfig()
-    accounts_config.validate_configuration()
-
-    # Split accounts into groups for parallel processing
-    account_groups = accounts_config.split_accounts_into_groups(num_groups=2)
-
     task_groups = []
 
-    # Create task groups for each account group
-    for group_idx, accounts_group in enumerate(account_groups, start=1):
-        group_id = f"accounts_group_{group_idx}"
-
+    if USE_BATCH_REQUESTS:
+        # One task per token: all accounts sharing a token are fetched with
+        # batched API calls, so each token is only ever used by one task
         with TaskGroup(
-            group_id=group_id,
-            tooltip=f"Process accounts {(group_idx-1)*len(accounts_group)+1} to {group_idx*len(accounts_group)}"
+            group_id="token_batches",
+            tooltip="Batched extraction, one task per Graph API token"
         ) as task_group:
 
-            for account in accounts_group:
-                # Calculate global account index for token rotation
-                global_idx = accounts_config.accounts.index(account)
-                _, token = accounts_config.get_account_with_token(global_idx)
-
-                # Create extraction task for this account
+            for token_idx, (token, accounts) in accounts_config.group_accounts_by_token().items():
                 extract_task = PythonOperator(
-                    task_id=f"extract_{account['table']}",
-                    python_callable=extract_account_data,
+                    task_id=f"extract_token_{token_idx + 1}",
+                    python_callable=extract_accounts_batch,
                     op_kwargs={
-                        'account_id': account['account_id'],
-                        'token': token,
-                        'table_name': account['table']
+                        'accounts': accounts,
+                        'token': token
                     },
                     trigger_rule=TriggerRule.ALL_DONE
                 )
 
         task_groups.append(task_group)
+    else:
+        # Split (account, token) pairs into groups for parallel processing;
+        # groups follow tokens, so parallel groups never share a token
+        account_groups = accounts_config.split_accounts_with_tokens_into_groups(num_groups=2)
+
+        # Create task groups for each account group
+        for group_idx, accounts_group in enumerate(account_groups, start=1):
+            group_id = f"accounts_group_{group_idx}"
+
+            with TaskGroup(
+                group_id=group_id,
+                tooltip=f"Process {len(accounts_group)} accounts (own token set)"
+            ) as task_group:
+
+                for account, token in accounts_group:
+                    # Create extraction task for this account
+                    extract_task = PythonOperator(
+                        task_id=f"extract_{account['table']}",
+                        python_callable=extract_account_data,
+                        op_kwargs={
+                            'account_id': account['account_id'],
+                            'token': token,
+                            'table_name': account['table']
+                        },
+                        trigger_rule=TriggerRule.ALL_DONE
+                    )
+
+            task_groups.append(task_group)
 
     # Create SQL Server sync task
     sync_task = PythonOperator(
@@ -167,9 +197,6 @@ with DAG(
     )
 
     # Set task dependencies
-    # Groups run sequentially, then sync runs after all groups complete
-    if len(task_groups) > 1:
-        for i in range(len(task_groups) - 1):
-            task_groups[i] >> task_groups[i + 1]
-
-    task_groups[-1] >> sync_task
+    # Groups run in parallel, then sync runs after all groups complete
+    for task_group in task_groups:
+        task_group >> sync_task
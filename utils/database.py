@@ -1,12 +1,40 @@
 import os
+import io
 import json
-from typing import List, Dict
+import itertools
+import re
+from functools import lru_cache
+from typing import List, Dict, Tuple
 from datetime import datetime, timedelta
 from urllib.parse import quote_plus
 
 import pandas as pd
-from sqlalchemy import create_engine, text, event, Engine
-from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, text, event, Engine, Connection
+
+
+# Supported strategies for DatabaseManager.upsert_dataframe
+UPSERT_STRATEGIES = ('delete_insert', 'on_conflict')
+
+# Schema/table/column names that may be interpolated into SQL
+IDENTIFIER_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def validate_identifier(name: str) -> str:
+    """
+    Ensure a SQL identifier is a plain name before interpolating it.
+
+    Args:
+        name: Schema, table or column name
+
+    Returns:
+        The identifier, unchanged
+
+    Raises:
+        ValueError: If the identifier contains unexpected characters
+    """
+    if not isinstance(name, str) or not IDENTIFIER_PATTERN.match(name):
+        raise ValueError(f"Invalid SQL identifier: '{name}'")
+    return name
 
 
 class DatabaseConfig:
@@ -56,13 +84,15 @@ class DatabaseManager:
         self.config = config or DatabaseConfig()
         self._postgres_engine = None
         self._sqlserver_engine = None
+        self._sql_columns_cache: Dict[Tuple[str, str], List[str]] = {}
 
     @property
     def postgres_engine(self) -> Engine:
         """Get or create PostgreSQL engine."""
         if self._postgres_engine is None:
             self._postgres_engine = create_engine(
-                self.config.get_postgres_connection_string()
+                self.config.get_postgres_connection_string(),
+                pool_pre_ping=True
             )
         return self._postgres_engine
 
@@ -71,7 +101,8 @@ class DatabaseManager:
         """Get or create SQL Server engine with fast_executemany enabled."""
         if self._sqlserver_engine is None:
             self._sqlserver_engine = create_engine(
-                self.config.get_sqlserver_connection_string()
+                self.config.get_sqlserver_connection_string(),
+                pool_pre_ping=True
             )
             # Enable fast_executemany for better performance
             @event.listens_for(self._sqlserver_engine, "before_cursor_execute")
@@ -86,49 +117,246 @@ class DatabaseManager:
         df: pd.DataFrame,
         table_name: str,
         date_column: str,
-        schema: str = None
+        schema: str = None,
+        strategy: str = 'delete_insert',
+        conflict_columns: List[str] = None
     ) -> None:
         """
-        Upsert DataFrame to PostgreSQL using delete-insert pattern.
+        Upsert DataFrame to PostgreSQL.
 
         Args:
             df: DataFrame to insert
             table_name: Target table name
             date_column: Column name containing dates for deletion range
             schema: Database schema name (default: from config)
+            strategy: 'delete_insert' or 'on_conflict'
+            conflict_columns: Unique key columns (required for 'on_conflict')
+
+        Raises:
+            ValueError: If strategy is unknown or conflict columns are missing
         """
-        if df.empty:
-            print(f"⚠️ DataFrame empty. Nothing to insert into {schema}.{table_name}")
-            return
+        if strategy not in UPSERT_STRATEGIES:
+            raise ValueError(
+                f"Invalid upsert strategy: '{strategy}'. "
+                f"Expected one of: {', '.join(UPSERT_STRATEGIES)}"
+            )
+
+        if strategy == 'on_conflict':
+            if not conflict_columns:
+                raise ValueError("conflict_columns are required for 'on_conflict' strategy")
+            self.upsert_many(
+                [(df, table_name, date_column)],
+                schema,
+                conflict_columns={table_name: conflict_columns}
+            )
+        else:
+            self.upsert_many([(df, table_name, date_column)], schema)
+
+    def upsert_on_conflict(
+        self,
+        df: pd.DataFrame,
+        table_name: str,
+        conflict_columns: List[str],
+        schema: str = None,
+        date_column: str = None
+    ) -> None:
+        """
+        Upsert DataFrame to PostgreSQL using INSERT ... ON CONFLICT DO UPDATE.
+
+        Args:
+            df: DataFrame to insert
+            table_name: Target table name
+            conflict_columns: Columns of the unique constraint to upsert on
+            schema: Database schema name (default: from config)
+            date_column: If given, rows in the DataFrame's date range that are
+                not present in the DataFrame are deleted
+        """
+        schema = schema or self.config.postgres_schema
+
+        with self.postgres_engine.begin() as conn:
+            self._merge_insert(conn, df, table_name, conflict_columns, schema, date_column)
 
+    def upsert_many(
+        self,
+        frames: List[Tuple[pd.DataFrame, str, str]],
+        schema: str = None,
+        conflict_columns: Dict[str, List[str]] = None,
+        date_range: Tuple = None
+    ) -> None:
+        """
+        Upsert several DataFrames to PostgreSQL in a single transaction.
+
+        Tables listed in ``conflict_columns`` are written with the
+        'on_conflict' strategy, all others with delete-insert. Everything
+        shares one connection and is committed together.
+
+        Args:
+            frames: List of (dataframe, table_name, date_column) tuples
+            schema: Database schema name (default: from config)
+            conflict_columns: Mapping of table_name -> unique key columns
+            date_range: Optional (min_date, max_date) replaced in every table,
+                even for empty DataFrames. Defaults to each DataFrame's own
+                date range.
+        """
         schema = schema or self.config.postgres_schema
-        min_date = df[date_column].min()
-        max_date = df[date_column].max()
+        conflict_columns = conflict_columns or {}
+
+        with self.postgres_engine.begin() as conn:
+            for df, table_name, date_column in frames:
+                if table_name in conflict_columns:
+                    self._merge_insert(
+                        conn, df, table_name, conflict_columns[table_name],
+                        schema, date_column, date_range
+                    )
+                else:
+                    self._delete_insert(
+                        conn, df, table_name, date_column, schema, date_range
+                    )
+
+    def _delete_date_range(
+        self,
+        conn: Connection,
+        table_name: str,
+        date_column: str,
+        date_range: Tuple,
+        schema: str
+    ) -> None:
+        """Delete all rows of a table within a date range using an open connection."""
+        min_date, max_date = date_range
 
         print(f"🗑️ Deleting from {schema}.{table_name} between {min_date} and {max_date}...")
 
         delete_query = text(f"""
             DELETE FROM {schema}.{table_name}
-            WHERE {date_column} BETWEEN :min_date AND :max_date
+            WHERE {date_column} >= :min_date AND {date_column} <= :max_date
         """)
+        conn.execute(delete_query, {"min_date": min_date, "max_date": max_date})
 
-        with self.postgres_engine.begin() as conn:
-            conn.execute(delete_query, {"min_date": min_date, "max_date": max_date})
+    def _delete_insert(
+        self,
+        conn: Connection,
+        df: pd.DataFrame,
+        table_name: str,
+        date_column: str,
+        schema: str,
+        date_range: Tuple = None
+    ) -> None:
+        """Replace a date range in a table using an open connection."""
+        if date_range is None and not df.empty:
+            date_range = (df[date_column].min(), df[date_column].max())
+
+        if date_range is not None:
+            self._delete_date_range(conn, table_name, date_column, date_range, schema)
+
+        if df.empty:
+            print(f"⚠️ DataFrame empty. Nothing to insert into {schema}.{table_name}")
+            return
 
         print(f"🚀 Inserting {len(df)} records into {schema}.{table_name}...")
 
-        df.to_sql(
-            name=table_name,
-            con=self.postgres_engine,
-            schema=schema,
-            if_exists='append',
-            index=False,
-            method='multi',
-            chunksize=1000
-        )
+        self._copy_insert(conn, df, table_name, schema)
 
         print(f"✅ {len(df)} records inserted into {schema}.{table_name}")
 
+    def _merge_insert(
+        self,
+        conn: Connection,
+        df: pd.DataFrame,
+        table_name: str,
+        conflict_columns: List[str],
+        schema: str,
+        date_column: str = None,
+        date_range: Tuple = None
+    ) -> None:
+        """
+        Upsert a DataFrame through a temporary staging table.
+
+        The DataFrame is COPYed into a TEMP table, then merged with
+        INSERT ... ON CONFLICT DO UPDATE. Rows whose values did not change are
+        left untouched, so unchanged data produces no new row versions.
+        """
+        if df.empty:
+            # Nothing to keep: every row in an explicit date range is stale
+            if date_column and date_range is not None:
+                self._delete_date_range(conn, table_name, date_column, date_range, schema)
+            print(f"⚠️ DataFrame empty. Nothing to insert into {schema}.{table_name}")
+            return
+
+        staging_table = f"staging_{table_name}"
+        target = f"{schema}.{table_name}"
+
+        columns = [f'"{col}"' for col in df.columns]
+        keys = [f'"{col}"' for col in conflict_columns]
+        updates = [col for col in columns if col not in keys]
+
+        conn.execute(text(f"CREATE TEMP TABLE {staging_table} (LIKE {target})"))
+        self._copy_insert(conn, df, staging_table, 'pg_temp')
+
+        if date_column:
+            if date_range is None:
+                date_range = (df[date_column].min(), df[date_column].max())
+            min_date, max_date = date_range
+
+            print(f"🗑️ Deleting stale rows from {target} between {min_date} and {max_date}...")
+
+            key_match = " AND ".join(f"s.{key} = t.{key}" for key in keys)
+            conn.execute(
+                text(f"""
+                    DELETE FROM {target} t
+                    WHERE t.{date_column} >= :min_date AND t.{date_column} <= :max_date
+                      AND NOT EXISTS (
+                          SELECT 1 FROM pg_temp.{staging_table} s WHERE {key_match}
+                      )
+                """),
+                {"min_date": min_date, "max_date": max_date}
+            )
+
+        if updates:
+            target_row = ", ".join(f"t.{col}" for col in updates)
+            excluded_row = ", ".join(f"EXCLUDED.{col}" for col in updates)
+            on_conflict = (
+                "DO UPDATE SET "
+                + ", ".join(f"{col} = EXCLUDED.{col}" for col in updates)
+                + f" WHERE ({target_row}) IS DISTINCT FROM ({excluded_row})"
+            )
+        else:
+            on_conflict = "DO NOTHING"
+
+        print(f"🚀 Upserting {len(df)} records into {target}...")
+
+        result = conn.execute(text(f"""
+            INSERT INTO {target} AS t ({", ".join(columns)})
+            SELECT DISTINCT ON ({", ".join(keys)}) {", ".join(columns)}
+            FROM pg_temp.{staging_table}
+            ON CONFLICT ({", ".join(keys)}) {on_conflict}
+        """))
+        conn.execute(text(f"DROP TABLE pg_temp.{staging_table}"))
+
+        print(f"✅ {result.rowcount} records inserted or updated in {target}")
+
+    def _copy_insert(
+        self,
+        conn: Connection,
+        df: pd.DataFrame,
+        table_name: str,
+        schema: str
+    ) -> None:
+        """Bulk load a DataFrame into PostgreSQL with COPY FROM STDIN."""
+        df = self._preprocess_dataframe(df)
+
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False, na_rep='\\N')
+        buffer.seek(0)
+
+        columns = ", ".join(f'"{col}"' for col in df.columns)
+        copy_query = (
+            f"COPY {schema}.{table_name} ({columns}) "
+            f"FROM STDIN WITH (FORMAT CSV, NULL '\\N')"
+        )
+
+        with conn.connection.cursor() as cursor:
+            cursor.copy_expert(copy_query, buffer)
+
     def sync_postgres_to_sqlserver(
         self,
         view_name: str,
@@ -137,12 +365,16 @@ class DatabaseManager:
         days: int = 15,
         source_schema: str = None,
         target_schema: str = None,
-        chunksize: int = 1000,
-        max_threads: int = 8
+        chunksize: int = 10000,
+        read_chunksize: int = 50000
     ) -> None:
         """
         Sync data from PostgreSQL view to SQL Server table.
 
+        Rows are streamed from PostgreSQL with a server-side cursor and
+        written to SQL Server chunk by chunk, so memory use is bounded by
+        read_chunksize rather than by the size of the view.
+
         Args:
             view_name: Source view name in PostgreSQL
             target_table: Target table name in SQL Server
@@ -151,87 +383,126 @@ class DatabaseManager:
             source_schema: PostgreSQL schema
             target_schema: SQL Server schema
             chunksize: Batch size for inserts
-            max_threads: Maximum parallel threads
+            read_chunksize: Number of rows read from PostgreSQL per chunk
         """
         source_schema = source_schema or self.config.postgres_schema
         target_schema = target_schema or self.config.sqlserver_schema
 
+        for identifier in (source_schema, view_name, target_schema, target_table, date_column):
+            validate_identifier(identifier)
+
         print(f"\n🔄 Starting sync: {source_schema}.{view_name} ➝ {target_schema}.{target_table}")
 
         # Read from PostgreSQL
         start_date = (datetime.now() - timedelta(days=days)).date()
-        query = f"""
+        query = text(f"""
             SELECT * FROM {source_schema}.{view_name}
-            WHERE {date_column} >= '{start_date}'
-        """
-
-        df = pd.read_sql(query, self.postgres_engine)
-        print(f"📥 Read {len(df)} records from {source_schema}.{view_name}")
-
-        if df.empty:
-            print(f"⚠️ No data found for {view_name}")
-            return
-
-        # Preprocess DataFrame
-        df = self._preprocess_dataframe(df)
-        df[date_column] = pd.to_datetime(df[date_column]).dt.date
+            WHERE {date_column} >= :start_date
+        """)
 
-        # Get and validate columns
+        # Get valid target columns
         sql_columns = self._get_sqlserver_columns(target_schema, target_table)
-        df = df[[col for col in df.columns if col in sql_columns]]
 
-        # Delete old data from SQL Server
         end_date = datetime.now().date()
-        with self.sqlserver_engine.begin() as conn:
-            conn.execute(
-                text(f"""
-                    DELETE FROM {target_schema}.{target_table}
-                    WHERE {date_column} BETWEEN :start AND :end
-                """),
-                {"start": start_date, "end": end_date}
+        total_records = 0
+
+        with self.postgres_engine.connect().execution_options(stream_results=True) as pg_conn:
+            chunks = pd.read_sql(
+                query,
+                pg_conn,
+                params={"start_date": start_date},
+                chunksize=read_chunksize
             )
-            print(f"🗑️ Deleted data from {target_schema}.{target_table} between {start_date} and {end_date}")
-
-        # Insert in chunks using ThreadPoolExecutor
-        chunks = [df.iloc[i:i+chunksize] for i in range(0, len(df), chunksize)]
-
-        def insert_chunk(chunk):
-            try:
-                chunk.to_sql(
-                    target_table,
-                    self.sqlserver_engine,
-                    schema=target_schema,
-                    if_exists='append',
-                    index=False
-                )
-            except Exception as e:
-                print(f"⚠️ Error inserting chunk: {e}")
-
-        with ThreadPoolExecutor(max_workers=max_threads) as executor:
-            list(executor.map(insert_chunk, chunks))
 
-        print(f"✅ Inserted {len(df)} records into {target_schema}.{target_table}")
+            first_chunk = next(chunks, None)
+            if first_chunk is None or first_chunk.empty:
+                print(f"⚠️ No data found for {view_name}")
+                return
+
+            # Replace the date range in SQL Server within a single transaction
+            with self.sqlserver_engine.begin() as conn:
+                conn.execute(
+                    text(f"""
+                        DELETE FROM {target_schema}.{target_table}
+                        WHERE {date_column} BETWEEN :start AND :end
+                    """),
+                    {"start": start_date, "end": end_date}
+                )
+                print(f"🗑️ Deleted data from {target_schema}.{target_table} between {start_date} and {end_date}")
+
+                for df in itertools.chain([first_chunk], chunks):
+                    # Preprocess chunk
+                    df = self._preprocess_dataframe(df)
+                    df = self._downcast_integers(df)
+                    df[date_column] = pd.to_datetime(df[date_column]).dt.date
+                    df = df[[col for col in df.columns if col in sql_columns]]
+
+                    # fast_executemany (see sqlserver_engine) sends each batch as one parameter array
+                    df.to_sql(
+                        target_table,
+                        conn,
+                        schema=target_schema,
+                        if_exists='append',
+                        index=False,
+                        chunksize=chunksize
+                    )
+
+                    total_records += len(df)
+                    print(f"📥 Synced {total_records} records from {source_schema}.{view_name}")
+
+        print(f"✅ Inserted {total_records} records into {target_schema}.{target_table}")
 
     def _preprocess_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
         """Preprocess DataFrame for SQL Server compatibility."""
-        df = df.copy()
-        for col in df.columns:
-            if df[col].apply(lambda x: isinstance(x, (dict, list))).any():
-                df[col] = df[col].apply(
-                    lambda x: json.dumps(x) if isinstance(x, (dict, list)) else x
-                )
+        # Only object columns can hold dict/list values
+        serialized = {}
+        for col in df.select_dtypes(include='object').columns:
+            values = df[col]
+            mask = values.map(lambda x: isinstance(x, (dict, list)))
+            if mask.any():
+                serialized[col] = values.mask(mask, values[mask].map(json.dumps))
+
+        if not serialized:
+            return df
+
+        # Shallow copy: only the replaced columns get new memory
+        df = df.copy(deep=False)
+        for col, values in serialized.items():
+            df[col] = values
         return df
 
-    def _get_sqlserver_columns(self, schema: str, table: str) -> List[str]:
-        """Get column names from SQL Server table."""
-        query = f"""
-            SELECT COLUMN_NAME
-            FROM INFORMATION_SCHEMA.COLUMNS
-            WHERE TABLE_SCHEMA = '{schema}' AND TABLE_NAME = '{table}'
+    @staticmethod
+    def _downcast_integers(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Shrink integer columns to the narrowest dtype that fits the chunk.
+
+        Float (e.g. spend) and text (e.g. unique_id) columns are left as is,
+        so monetary precision and hash keys are unaffected.
         """
-        with self.sqlserver_engine.connect() as conn:
-            result = conn.execute(text(query))
-            return [row[0] for row in result]
+        int_columns = df.select_dtypes(include='integer').columns
+        if int_columns.empty:
+            return df
+
+        # Shallow copy: only the downcast columns get new memory
+        df = df.copy(deep=False)
+        for col in int_columns:
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+        return df
+
+    def _get_sqlserver_columns(self, schema: str, table: str) -> List[str]:
+        """Get column names from SQL Server table (cached per instance)."""
+        key = (schema, table)
+        if key not in self._sql_columns_cache:
+            query = text("""
+                SELECT COLUMN_NAME
+                FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE TABLE_SCHEMA = :schema AND TABLE_NAME = :table
+            """)
+            with self.sqlserver_engine.connect() as conn:
+                result = conn.execute(query, {"schema": schema, "table": table})
+                self._sql_columns_cache[key] = [row[0] for row in result]
+
+        return self._sql_columns_cache[key]
 
     def dispose(self):
         """Dispose all database connections."""
@@ -239,3 +510,18 @@ class DatabaseManager:
             self._postgres_engine.dispose()
         if self._sqlserver_engine:
             self._sqlserver_engine.dispose()
+        self._sql_columns_cache.clear()
+
+
+@lru_cache(maxsize=1)
+def get_db_manager() -> DatabaseManager:
+    """
+    Get the process-wide DatabaseManager.
+
+    Engines (and their connection pools) are created lazily on first use and
+    then shared by every task that runs in the same worker process.
+
+    Returns:
+        Shared DatabaseManager instance
+    """
+    return DatabaseManager(DatabaseConfig())
@@ -2,11 +2,21 @@ import os
 import time
 import json
 import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, timedelta
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, List, Tuple, Optional
+from urllib.parse import urlencode
 
 import requests
 import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Graph API error codes that signal throttling (app, user, page, custom and ads insights limits)
+RATE_LIMIT_ERROR_CODES = (4, 17, 32, 613, 80004)
 
 
 class GraphAPIConfig:
@@ -17,12 +27,51 @@ class GraphAPIConfig:
         self.request_timeout = int(os.getenv('API_REQUEST_TIMEOUT', '30'))
         self.rate_limit_sleep = int(os.getenv('RATE_LIMIT_SLEEP_SECONDS', '60'))
         self.data_retention_days = int(os.getenv('DATA_RETENTION_DAYS', '15'))
+        self.max_retries = int(os.getenv('API_MAX_RETRIES', '3'))
+        self.usage_throttle_threshold = int(os.getenv('API_USAGE_THROTTLE_PERCENT', '90'))
+
+
+def create_session(access_token: str, config: GraphAPIConfig) -> requests.Session:
+    """
+    Create an HTTP session with keep-alive, connection pooling and retries.
+
+    The access token is sent as a bearer header so it never appears in
+    request URLs.
+
+    Args:
+        access_token: Graph API access token
+        config: API configuration object
+
+    Returns:
+        Configured requests Session
+    """
+    session = requests.Session()
+    session.headers['Authorization'] = f"Bearer {access_token}"
+
+    retries = Retry(
+        total=config.max_retries,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False
+    )
+    session.mount(
+        'https://',
+        HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retries)
+    )
+
+    return session
 
 
 class GraphAPIClient:
     """Client for interacting with Meta Graph API."""
 
-    def __init__(self, account_id: str, access_token: str, config: GraphAPIConfig = None):
+    def __init__(
+        self,
+        account_id: str,
+        access_token: str,
+        config: GraphAPIConfig = None,
+        session: requests.Session = None
+    ):
         """
         Initialize Graph API client.
 
@@ -30,6 +79,7 @@ class GraphAPIClient:
             account_id: Meta Ads account ID (without 'act_' prefix)
             access_token: Graph API access token
             config: API configuration object
+            session: Existing HTTP session to reuse (default: a new one)
         """
         self.account_id = account_id
         self.access_token = access_token
@@ -44,6 +94,8 @@ class GraphAPIClient:
             f"act_{account_id}/campaigns"
         )
 
+        self.session = session or create_session(access_token, self.config)
+
     def get_time_range(self) -> Dict[str, str]:
         """
         Get time range for API requests based on data retention configuration.
@@ -73,22 +125,26 @@ class GraphAPIClient:
         next_url = url
         page_count = 1
 
-        print(f"📡 Starting API request: {url}")
+        logger.info(f"📡 Starting API request: {url}")
 
         while next_url:
             try:
-                response = requests.get(
+                response = self.session.get(
                     next_url,
                     params=params if next_url == url else None,
                     timeout=self.config.request_timeout
                 )
 
                 if response.status_code != 200:
-                    print(f"❌ Error {response.status_code}: {response.text}")
+                    error = self._get_error(response)
+                    logger.warning(
+                        f"❌ Error {response.status_code}: "
+                        f"code={error.get('code')} {error.get('message', '')}"
+                    )
 
                     # Handle rate limiting
-                    if "too many calls" in response.text.lower():
-                        print(f"⏳ Rate limit hit, waiting {self.config.rate_limit_sleep}s...")
+                    if error.get('code') in RATE_LIMIT_ERROR_CODES:
+                        logger.warning(f"⏳ Rate limit hit, waiting {self.config.rate_limit_sleep}s...")
                         time.sleep(self.config.rate_limit_sleep)
                         continue
 
@@ -98,27 +154,88 @@ class GraphAPIClient:
                 data = json_data.get('data', [])
                 all_data.extend(data)
 
-                print(f"✅ Page {page_count} - {len(data)} items retrieved")
+                logger.info(f"✅ Page {page_count} - {len(data)} items retrieved")
 
                 # Get next page URL
                 next_url = json_data.get('paging', {}).get('next')
                 page_count += 1
 
+                # Back off before the next page when close to the usage limit
+                usage = self._get_business_usage(response)
+                if next_url and usage >= self.config.usage_throttle_threshold:
+                    logger.warning(
+                        f"⏳ Business use case usage at {usage}%, "
+                        f"waiting {self.config.rate_limit_sleep}s..."
+                    )
+                    time.sleep(self.config.rate_limit_sleep)
+
             except requests.exceptions.RequestException as e:
-                print(f"❌ Request error: {e}")
+                logger.warning(f"❌ Request error: {e}")
                 break
 
-        print(f"📊 Total items retrieved: {len(all_data)}")
+        logger.info(f"📊 Total items retrieved: {len(all_data)}")
         return all_data
 
-    def get_insights(self) -> List[Dict]:
+    @staticmethod
+    def _get_error(response: requests.Response) -> Dict:
         """
-        Fetch ad insights from Graph API.
+        Extract the structured Graph API error from a failed response.
+
+        Args:
+            response: Non-200 HTTP response
 
         Returns:
-            List of insight records
+            Error dictionary (empty if the body is not a Graph API error)
         """
-        params = {
+        try:
+            error = response.json().get('error', {})
+        except ValueError:
+            return {}
+        return error if isinstance(error, dict) else {}
+
+    @staticmethod
+    def _get_business_usage(response: requests.Response) -> int:
+        """
+        Get the highest usage percentage from the X-Business-Use-Case-Usage header.
+
+        Args:
+            response: HTTP response from Graph API
+
+        Returns:
+            Highest of call_count/total_cputime/total_time, or 0 if absent
+        """
+        header = response.headers.get('X-Business-Use-Case-Usage')
+        if not header:
+            return 0
+
+        try:
+            usage = json.loads(header)
+        except ValueError:
+            return 0
+
+        # The header is only a throttling hint; ignore anything unexpected
+        if not isinstance(usage, dict):
+            return 0
+
+        values = [
+            entry.get(metric, 0)
+            for entries in usage.values() if isinstance(entries, list)
+            for entry in entries if isinstance(entry, dict)
+            for metric in ('call_count', 'total_cputime', 'total_time')
+        ]
+        return max(
+            (value for value in values if isinstance(value, (int, float))),
+            default=0
+        )
+
+    def get_insights_params(self) -> Dict:
+        """
+        Build request parameters for the insights endpoint.
+
+        Returns:
+            Dictionary of query parameters
+        """
+        return {
             "time_increment": 1,
             "time_range": json.dumps(self.get_time_range()),
             "level": "ad",
@@ -126,11 +243,28 @@ class GraphAPIClient:
                 "ad_name,ad_id,adset_name,adset_id,campaign_name,campaign_id,"
                 "account_id,account_name,spend,clicks,inline_link_clicks,"
                 "impressions,objective,actions,date_start"
-            ),
-            "access_token": self.access_token
+            )
         }
 
-        return self.paginate_api(self.insights_url, params)
+    def get_campaigns_params(self) -> Dict:
+        """
+        Build request parameters for the campaigns endpoint.
+
+        Returns:
+            Dictionary of query parameters
+        """
+        return {
+            "fields": "id,name,status,start_time"
+        }
+
+    def get_insights(self) -> List[Dict]:
+        """
+        Fetch ad insights from Graph API.
+
+        Returns:
+            List of insight records
+        """
+        return self.paginate_api(self.insights_url, self.get_insights_params())
 
     def get_campaigns(self) -> List[Dict]:
         """
@@ -139,30 +273,212 @@ class GraphAPIClient:
         Returns:
             List of campaign records
         """
-        params = {
-            "fields": "id,name,status,start_time",
-            "access_token": self.access_token
+        return self.paginate_api(self.campaigns_url, self.get_campaigns_params())
+
+    def get_insights_and_campaigns(self) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Fetch insights and campaigns concurrently.
+
+        Both endpoints are paginated independently, so their requests are
+        overlapped on the shared session instead of running back to back.
+
+        Returns:
+            Tuple of (insight_records, campaign_records)
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            insights_future = executor.submit(self.get_insights)
+            campaigns_future = executor.submit(self.get_campaigns)
+
+            return insights_future.result(), campaigns_future.result()
+
+
+class GraphAPIBatchClient:
+    """
+    Client for Graph API batch requests across accounts sharing one token.
+
+    First pages of the insights and campaigns endpoints for every account are
+    sent as sub-requests of ``POST /?batch=[...]`` (up to 50 per HTTP call).
+    Remaining pages are followed per account, and any failed sub-request falls
+    back to a regular GraphAPIClient fetch.
+    """
+
+    MAX_BATCH_SIZE = 50
+
+    def __init__(self, access_token: str, config: GraphAPIConfig = None):
+        """
+        Initialize Graph API batch client.
+
+        Args:
+            access_token: Graph API access token shared by the accounts
+            config: API configuration object
+        """
+        self.access_token = access_token
+        self.config = config or GraphAPIConfig()
+        self.batch_url = f"https://graph.facebook.com/{self.config.api_version}"
+        self.session = create_session(access_token, self.config)
+
+    def batch(self, sub_requests: List[Dict]) -> List[Optional[Dict]]:
+        """
+        Execute sub-requests in batches of up to MAX_BATCH_SIZE.
+
+        Args:
+            sub_requests: List of {'method': ..., 'relative_url': ...} dicts
+
+        Returns:
+            Parsed response bodies in request order (None for failed sub-requests)
+        """
+        results = []
+        for i in range(0, len(sub_requests), self.MAX_BATCH_SIZE):
+            results.extend(self._post_batch(sub_requests[i:i + self.MAX_BATCH_SIZE]))
+        return results
+
+    def _post_batch(self, sub_requests: List[Dict]) -> List[Optional[Dict]]:
+        """Send one batch request, retrying while rate limited."""
+        logger.info(f"📡 Starting batch request with {len(sub_requests)} sub-requests")
+
+        while True:
+            try:
+                response = self.session.post(
+                    self.batch_url,
+                    data={"batch": json.dumps(sub_requests)},
+                    timeout=self.config.request_timeout
+                )
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"❌ Batch request error: {e}")
+                return [None] * len(sub_requests)
+
+            if response.status_code == 200:
+                break
+
+            error = GraphAPIClient._get_error(response)
+            logger.warning(
+                f"❌ Batch error {response.status_code}: "
+                f"code={error.get('code')} {error.get('message', '')}"
+            )
+
+            if error.get('code') in RATE_LIMIT_ERROR_CODES:
+                logger.warning(f"⏳ Rate limit hit, waiting {self.config.rate_limit_sleep}s...")
+                time.sleep(self.config.rate_limit_sleep)
+                continue
+
+            return [None] * len(sub_requests)
+
+        results = []
+        for item in response.json():
+            # Sub-requests that timed out come back as null
+            if not item or item.get('code') != 200:
+                results.append(None)
+                continue
+
+            try:
+                results.append(json.loads(item.get('body') or '{}'))
+            except ValueError:
+                results.append(None)
+
+        return results
+
+    def get_insights_and_campaigns(
+        self,
+        account_ids: List[str]
+    ) -> Dict[str, Tuple[List[Dict], List[Dict]]]:
+        """
+        Fetch insights and campaigns for several accounts.
+
+        Args:
+            account_ids: Meta Ads account IDs (without 'act_' prefix)
+
+        Returns:
+            Mapping of account_id -> (insight_records, campaign_records)
+        """
+        clients = {
+            account_id: GraphAPIClient(
+                account_id, self.access_token, self.config, session=self.session
+            )
+            for account_id in account_ids
         }
 
-        return self.paginate_api(self.campaigns_url, params)
+        sub_requests = []
+        for account_id, client in clients.items():
+            sub_requests.append({
+                "method": "GET",
+                "relative_url": f"act_{account_id}/insights?{urlencode(client.get_insights_params())}"
+            })
+            sub_requests.append({
+                "method": "GET",
+                "relative_url": f"act_{account_id}/campaigns?{urlencode(client.get_campaigns_params())}"
+            })
+
+        bodies = self.batch(sub_requests)
+
+        results = {}
+        for idx, (account_id, client) in enumerate(clients.items()):
+            insights = self._collect(client, bodies[2 * idx], client.get_insights)
+            campaigns = self._collect(client, bodies[2 * idx + 1], client.get_campaigns)
+            results[account_id] = (insights, campaigns)
+
+        return results
+
+    @staticmethod
+    def _collect(
+        client: GraphAPIClient,
+        body: Optional[Dict],
+        fallback: Callable[[], List[Dict]]
+    ) -> List[Dict]:
+        """Combine a batched first page with its remaining pages."""
+        if body is None:
+            logger.warning(f"⚠️ Batched request failed for account {client.account_id}, fetching directly")
+            return fallback()
+
+        data = list(body.get('data', []))
+        next_url = body.get('paging', {}).get('next')
+        if next_url:
+            data.extend(client.paginate_api(next_url, None))
+
+        return data
 
 
 class GraphAPIDataProcessor:
     """Process and transform Graph API data for database storage."""
 
+    # Insight fields copied verbatim into the ads DataFrame
+    INSIGHT_TEXT_FIELDS = [
+        'account_name', 'adset_id', 'adset_name', 'ad_id', 'ad_name',
+        'campaign_id', 'campaign_name', 'objective'
+    ]
+
+    # Numeric insight fields and their target dtypes (missing values -> 0)
+    INSIGHT_NUMERIC_FIELDS = {
+        'spend': 'float64',
+        'clicks': 'int64',
+        'inline_link_clicks': 'int64',
+        'impressions': 'int64'
+    }
+
+    @staticmethod
+    def _normalize_missing(df: pd.DataFrame) -> pd.DataFrame:
+        """Replace NaN placeholders from json_normalize/reindex with None."""
+        return df.astype(object).where(df.notna(), None)
+
     @staticmethod
-    def generate_unique_id(row: pd.Series) -> str:
+    def generate_unique_ids(df: pd.DataFrame) -> pd.Series:
         """
-        Generate MD5 hash for row to use as unique identifier.
+        Generate MD5 hashes for all rows to use as unique identifiers.
+
+        Row values are stringified and joined column-wise in a single pass,
+        so only the hashing itself runs once per row.
 
         Args:
-            row: Pandas Series representing a row
+            df: DataFrame whose rows should be hashed
 
         Returns:
-            MD5 hash string
+            Series of MD5 hash strings aligned with the DataFrame index
         """
-        concatenated = "_".join(row.astype(str))
-        return hashlib.md5(concatenated.encode()).hexdigest()
+        cols = df.astype(str)
+        concatenated = cols.iloc[:, 0].str.cat(
+            [cols[col] for col in cols.columns[1:]],
+            sep='_'
+        )
+        return concatenated.map(lambda s: hashlib.md5(s.encode()).hexdigest())
 
     @staticmethod
     def process_insights_data(
@@ -181,42 +497,32 @@ class GraphAPIDataProcessor:
         Returns:
             Tuple of (ads_dataframe, actions_dataframe)
         """
-        adset_data = []
-        actions_data = []
+        # Build ad-level rows in a single pass over the raw insights
+        df_adset = pd.json_normalize(insights, max_level=0).reindex(
+            columns=GraphAPIDataProcessor.INSIGHT_TEXT_FIELDS
+            + list(GraphAPIDataProcessor.INSIGHT_NUMERIC_FIELDS)
+            + ['date_start']
+        )
+        df_adset = GraphAPIDataProcessor._normalize_missing(df_adset)
 
-        # Process insights
-        for item in insights:
-            adset_info = {
-                'account_id': account_id,
-                'account_name': item.get('account_name'),
-                'adset_id': item.get('adset_id'),
-                'adset_name': item.get('adset_name'),
-                'ad_id': item.get('ad_id'),
-                'ad_name': item.get('ad_name'),
-                'campaign_id': item.get('campaign_id'),
-                'campaign_name': item.get('campaign_name'),
-                'objective': item.get('objective'),
-                'spend': float(item.get('spend', 0)),
-                'clicks': int(item.get('clicks', 0)),
-                'inline_link_clicks': int(item.get('inline_link_clicks', 0)),
-                'impressions': int(item.get('impressions', 0)),
-                'date': item.get('date_start')
-            }
-            adset_data.append(adset_info)
-
-            # Process actions
-            for action in item.get('actions', []):
-                actions_data.append({
-                    'account_id': account_id,
-                    'ad_id': item.get('ad_id'),
-                    'action_type': action.get('action_type'),
-                    'value': int(action.get('value', 0)),
-                    'date': adset_info['date']
-                })
-
-        # Create DataFrames
-        df_adset = pd.DataFrame(adset_data)
-        df_actions = pd.DataFrame(actions_data)
+        for col, dtype in GraphAPIDataProcessor.INSIGHT_NUMERIC_FIELDS.items():
+            df_adset[col] = pd.to_numeric(df_adset[col]).fillna(0).astype(dtype)
+
+        df_adset = df_adset.rename(columns={'date_start': 'date'})
+        df_adset.insert(0, 'account_id', account_id)
+
+        # Explode actions into one row per (ad, date, action_type)
+        df_actions = pd.json_normalize(
+            [item for item in insights if item.get('actions')],
+            record_path='actions',
+            meta=['ad_id', 'date_start'],
+            errors='ignore'
+        ).reindex(columns=['ad_id', 'action_type', 'value', 'date_start'])
+        df_actions = GraphAPIDataProcessor._normalize_missing(df_actions)
+
+        df_actions['value'] = pd.to_numeric(df_actions['value']).fillna(0).astype('int64')
+        df_actions = df_actions.rename(columns={'date_start': 'date'})
+        df_actions.insert(0, 'account_id', account_id)
 
         # Process campaigns
         campaigns_data = []
@@ -240,10 +546,7 @@ class GraphAPIDataProcessor:
 
         # Add unique identifier
         if not df_ads.empty:
-            df_ads['unique_id'] = df_ads.apply(
-                GraphAPIDataProcessor.generate_unique_id,
-                axis=1
-            )
+            df_ads['unique_id'] = GraphAPIDataProcessor.generate_unique_ids(df_ads)
 
         return df_ads, df_actions
 
@@ -275,14 +578,91 @@ def extract_meta_ads_data(
     client = GraphAPIClient(account_id, access_token)
 
     # Fetch data from API
-    print("📥 Fetching insights data...")
-    insights = client.get_insights()
+    print("📥 Fetching insights and campaigns data...")
+    insights, campaigns = client.get_insights_and_campaigns()
+
+    print("✅ Data extraction completed\n")
+
+    save_meta_ads_data(
+        account_id, insights, campaigns,
+        table_name, actions_table_name, db_manager, schema
+    )
 
-    print("📥 Fetching campaigns data...")
-    campaigns = client.get_campaigns()
+
+def extract_meta_ads_data_batch(
+    accounts: List[Dict[str, str]],
+    access_token: str,
+    db_manager,
+    schema: str = None
+) -> None:
+    """
+    Extraction function for several accounts sharing one token.
+
+    API calls for all accounts are combined through GraphAPIBatchClient;
+    each account is then processed and saved on its own.
+
+    Args:
+        accounts: Account configurations ({'account_id': ..., 'table': ...})
+        access_token: Graph API access token shared by the accounts
+        db_manager: DatabaseManager instance
+        schema: Database schema name
+
+    Raises:
+        RuntimeError: If saving failed for one or more accounts
+    """
+    account_ids = [account['account_id'] for account in accounts]
+
+    print(f"\n{'='*60}")
+    print(f"🚀 Starting batched extraction for accounts: {', '.join(account_ids)}")
+    print(f"{'='*60}\n")
+
+    # Fetch data from API
+    print("📥 Fetching insights and campaigns data...")
+    client = GraphAPIBatchClient(access_token)
+    results = client.get_insights_and_campaigns(account_ids)
 
     print("✅ Data extraction completed\n")
 
+    # Save each account independently so one failure does not skip the rest
+    failed_accounts = []
+    for account in accounts:
+        insights, campaigns = results[account['account_id']]
+        try:
+            save_meta_ads_data(
+                account['account_id'], insights, campaigns,
+                account['table'], f"{account['table']}_actions", db_manager, schema
+            )
+        except Exception as e:
+            print(f"❌ Failed to save account {account['account_id']}: {e}")
+            failed_accounts.append(account['account_id'])
+
+    if failed_accounts:
+        raise RuntimeError(
+            f"Batched extraction failed for accounts: {', '.join(failed_accounts)}"
+        )
+
+
+def save_meta_ads_data(
+    account_id: str,
+    insights: List[Dict],
+    campaigns: List[Dict],
+    table_name: str,
+    actions_table_name: str,
+    db_manager,
+    schema: str = None
+) -> None:
+    """
+    Process raw API data for one account and save it to the database.
+
+    Args:
+        account_id: Meta Ads account ID
+        insights: Raw insights data from API
+        campaigns: Raw campaigns data from API
+        table_name: Target table for ads data
+        actions_table_name: Target table for actions data
+        db_manager: DatabaseManager instance
+        schema: Database schema name
+    """
     # Process data
     print("🔄 Processing data...")
     processor = GraphAPIDataProcessor()
@@ -293,10 +673,23 @@ def extract_meta_ads_data(
     print(f"📊 Processed {len(df_ads)} ad records")
     print(f"📊 Processed {len(df_actions)} action records\n")
 
+    # Actions come from the same insights, so the ads date range covers both
+    # tables and also clears stale actions on dates that no longer have any
+    date_range = None
+    if not df_ads.empty:
+        date_range = (df_ads["date"].min(), df_ads["date"].max())
+
     # Save to database
     print("💾 Saving to database...")
-    db_manager.upsert_dataframe(df_ads, table_name, "date", schema)
-    db_manager.upsert_dataframe(df_actions, actions_table_name, "date", schema)
+    db_manager.upsert_many(
+        [
+            (df_ads, table_name, "date"),
+            (df_actions, actions_table_name, "date"),
+        ],
+        schema,
+        conflict_columns={table_name: ["unique_id"]},
+        date_range=date_range
+    )
 
     print(f"\n{'='*60}")
     print(f"✅ Extraction completed successfully for account: {account_id}")